@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import joblib
 from datetime import datetime, timedelta
-import plotly.graph_objects as go
 
 st.set_page_config(
     page_title="Dispatch Call Forecaster",
@@ -23,11 +23,11 @@ st.markdown("""
     #MainMenu, footer { visibility: hidden; }
     h1, h2, h3 { color: var(--text-color); font-weight: 600; }
     
-    .stButton > button {
+    .stButton > button, .stFormSubmitButton > button {
         background-color: var(--primary-accent); color: white; border-radius: 8px; border: none;
         padding: 0.75rem 1.5rem; font-weight: 600; transition: background-color 0.2s ease;
     }
-    .stButton > button:hover { background-color: #4F46E5; }
+    .stButton > button:hover, .stFormSubmitButton > button:hover { background-color: #4F46E5; }
     
     .stSlider [data-baseweb="slider"] > div:nth-child(3) {
         background: var(--primary-accent) !important;
@@ -42,76 +42,135 @@ st.markdown("""
 
 
 # Data and Model Loading
-ORGANIZATION_DATA = [
-    {"organization_id": 80, "hospital_name": "County General", "unit_name": "Floor 1"},
-    {"organization_id": 99, "hospital_name": "County General", "unit_name": "Floor 2"},
-    {"organization_id": 74, "hospital_name": "County General", "unit_name": "Floor 3"},
-    {"organization_id": 35, "hospital_name": "County General", "unit_name": "Floor 4"},
-    {"organization_id": 73, "hospital_name": "County General", "unit_name": "Floor 5"},
-    {"organization_id": 36, "hospital_name": "County General", "unit_name": "Floor 6"},
-    {"organization_id": 93, "hospital_name": "County General", "unit_name": "Floor 7"},
-    {"organization_id": 94, "hospital_name": "County General", "unit_name": "Floor 8"},
-    {"organization_id": 81, "hospital_name": "County General", "unit_name": "Floor 9"},
-    {"organization_id": 78, "hospital_name": "Seattle Grace", "unit_name": "Unit 1"},
-    {"organization_id": 91, "hospital_name": "Seattle Grace", "unit_name": "Unit 2"},
-    {"organization_id": 71, "hospital_name": "Seattle Grace", "unit_name": "Unit 3"},
-    {"organization_id": 90, "hospital_name": "Seattle Grace", "unit_name": "Unit 4"},
-    {"organization_id": 70, "hospital_name": "Seattle Grace", "unit_name": "Unit 5"},
-    {"organization_id": 72, "hospital_name": "Seattle Grace", "unit_name": "Unit 6"},
-    {"organization_id": 82, "hospital_name": "Seattle Grace", "unit_name": "Unit 7"},
-    {"organization_id": 77, "hospital_name": "Seattle Grace", "unit_name": "Unit 8"},
-    {"organization_id": 89, "hospital_name": "Seattle Grace", "unit_name": "Unit 9"}
-]
+CALL_CATEGORIES = ('Clinical', 'Mobility', 'Basic Need', 'Housekeeping', 'Other')
+CATEGORY_COLORS = {'Clinical': '#6366F1', 'Mobility': '#14B8A6', 'Basic Need': '#F97316', 'Housekeeping': '#EC4899', 'Other': '#6B7280'}
 
 @st.cache_data
 def load_organization_data():
-    df = pd.DataFrame(ORGANIZATION_DATA)
+    try:
+        df = pd.read_csv('app/organizations.csv')
+    except FileNotFoundError:
+        df = pd.DataFrame(columns=['organization_id', 'hospital_name', 'unit_name'])
     unit_to_org_id = pd.Series(df.organization_id.values, index=df.unit_name).to_dict()
-    return df, unit_to_org_id
+    hospital_to_units = df.groupby('hospital_name', sort=False)['unit_name'].apply(list).to_dict()
+    return df, unit_to_org_id, hospital_to_units
 
 @st.cache_resource
 def load_model():
     try:
-        model = joblib.load('models/call_forecasting_model.pkl')
+        # mmap_mode skips joblib's intermediate read buffer; sklearn still copies the trees into its own
+        model = joblib.load('models/call_forecasting_model.pkl', mmap_mode='r')
         model_cols = joblib.load('models/model_feature_columns.pkl')
-        return model, model_cols
+        # Thread dispatch costs more than it saves on batches of a few hundred rows
+        model.n_jobs = 1
+        col_index = {col: i for i, col in enumerate(model_cols)}
+        org_col_index = {int(col.rsplit('_', 1)[1]): i for col, i in col_index.items() if col.startswith('organization_id_')}
+        return model, model_cols, col_index, org_col_index
     except FileNotFoundError:
-        return None, None
-
-org_data, unit_to_org_id_map = load_organization_data()
-model, model_feature_columns = load_model()
-
-def generate_single_unit_forecast(start_time, duration, census, organization_id, feature_columns):
-    timestamps = [start_time + timedelta(hours=h) for h in range(duration)]
-    predictions = []
+        return None, None, {}, {}
+
+org_data, unit_to_org_id_map, hospital_units = load_organization_data()
+hospital_names = tuple(hospital_units.keys())
+model, model_feature_columns, feature_index, org_feature_index = load_model()
+
+# The model and lookup tables are fixed per process, so only the arguments key the cache
+@st.cache_data(show_spinner=False, max_entries=512)
+def generate_multi_unit_forecast(start_time, duration, unit_census_map):
+    timestamps = pd.date_range(start=start_time, periods=duration, freq='h')
+    units = [unit for unit in unit_census_map if unit_to_org_id_map.get(unit)]
+    if not units:
+        return timestamps, {}
+    censuses = np.fromiter((unit_census_map[unit] for unit in units), dtype=np.float32, count=len(units))
+
+    # One row per (unit, hour), unit-major
+    features = np.zeros((len(units) * duration, len(model_feature_columns)), dtype=np.float32)
+    features[:, feature_index['rooms_with_patients']] = np.repeat(censuses, duration)
+    features[:, feature_index['hour_of_day']] = np.tile(timestamps.hour, len(units))
+    features[:, feature_index['day_of_week']] = np.tile(timestamps.dayofweek, len(units))
+
+    # -1 marks orgs the model never saw
+    unit_org_cols = np.array([org_feature_index.get(unit_to_org_id_map[unit], -1) for unit in units])
+    org_cols = np.repeat(unit_org_cols, duration)
+    known = org_cols >= 0
+    features[np.flatnonzero(known), org_cols[known]] = 1
+
+    # copy=False passes the float32 buffer through unchanged
+    predictions = model.predict(pd.DataFrame(features, columns=model_feature_columns, copy=False))
+    np.maximum(predictions, 0, out=predictions)
+
+    return timestamps, dict(zip(units, np.split(predictions, len(units))))
+
+@st.cache_data(max_entries=16)
+def build_area_figure(forecast_df):
+    # plotly is only needed once there is a forecast to chart
+    import plotly.graph_objects as go
+    fig_area = go.Figure(data=[go.Scatter(
+        x=forecast_df.index, y=forecast_df[category], mode='lines', stackgroup='one',
+        name=category, fillcolor=CATEGORY_COLORS.get(category), line=dict(width=0.5)
+    ) for category in forecast_df.columns])
+    fig_area.update_layout(template="plotly_dark", hovermode='x unified', margin=dict(t=10, b=10), height=400,
+                           legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    return fig_area
+
+@st.cache_data(max_entries=16)
+def build_pie_figure(forecast_df):
+    import plotly.graph_objects as go
+    category_totals = forecast_df.sum().sort_values(ascending=False)
+    fig_pie = go.Figure(data=[go.Pie(labels=category_totals.index, values=category_totals.values, hole=0.4,
+                                     marker=dict(colors=[CATEGORY_COLORS.get(cat) for cat in category_totals.index]))])
+    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+    fig_pie.update_layout(showlegend=False, margin=dict(t=10, b=10), height=400, template="plotly_dark")
+    return fig_pie
+
+@st.fragment
+def render_forecast_results():
+    st.header(f"📈 Forecast Results for {st.session_state['details']['hospital']}")
     
-    org_id_cols = [col for col in feature_columns if col.startswith('organization_id_')]
+    unit_forecasts = st.session_state['unit_forecasts']
+    all_units = list(unit_forecasts.keys())
     
-    for ts in timestamps:
-        feature_data = {
-            'rooms_with_patients': census,
-            'hour_of_day': ts.hour,
-            'day_of_week': ts.weekday()
-        }
-        
-        for col in org_id_cols:
-            feature_data[col] = 0
-        
-        current_org_col = f'organization_id_{organization_id}'
-        if current_org_col in feature_data:
-            feature_data[current_org_col] = 1
-
-        features_df = pd.DataFrame([feature_data])
-        
-        features_df = features_df[feature_columns]
-        
-        prediction = model.predict(features_df)
-        
-        positive_prediction = [max(0, val) for val in prediction[0]]
-        predictions.append(positive_prediction)
-        
-    categories = ['Clinical', 'Mobility', 'Basic Need', 'Housekeeping', 'Other']
-    return pd.DataFrame(predictions, columns=categories, index=pd.to_datetime(timestamps))
+    selected_units_for_view = all_units
+    if st.session_state['details']['unit'] == "All":
+        selected_units_for_view = st.multiselect("Filter units to display:", options=all_units, default=all_units, help="Select one or more units to view their combined forecast.")
+
+    if not selected_units_for_view:
+        st.warning("Please select at least one unit to display results.")
+    else:
+        valid_forecasts = [unit_forecasts[unit] for unit in selected_units_for_view if unit_forecasts[unit].size]
+        if not valid_forecasts:
+            st.warning("No valid forecast data to display for the selected units.")
+        else:
+            forecast_df = pd.DataFrame(np.sum(valid_forecasts, axis=0),
+                                       index=st.session_state['forecast_index'], columns=CALL_CATEGORIES)
+            
+            totals_per_hour = forecast_df.to_numpy().sum(axis=1)
+            total_calls = totals_per_hour.sum()
+            peak_index = int(totals_per_hour.argmax())
+            peak_hour = forecast_df.index[peak_index]
+            peak_volume = totals_per_hour[peak_index]
+            metric_cols = st.columns(3)
+            metric_cols[0].metric("Total Predicted Calls", f"{total_calls:.1f}")
+            metric_cols[1].metric("Predicted Peak Hour", peak_hour.strftime('%H:%M'))
+            metric_cols[2].metric("Calls During Peak Hour", f"{peak_volume:.1f}")
+            
+            st.divider()
+
+            st.subheader("Hourly Call Volume by Category")
+            st.plotly_chart(build_area_figure(forecast_df), use_container_width=True)
+
+            col_left, col_right = st.columns(2)
+            with col_left:
+                st.subheader("Total Call Distribution")
+                st.plotly_chart(build_pie_figure(forecast_df), use_container_width=True)
+
+            with col_right:
+                st.subheader("Detailed Forecast Data")
+                display_df = forecast_df.copy()
+                display_df['Total'] = totals_per_hour
+                display_df.index = display_df.index.strftime('%Y-%m-%d %H:%M')
+                number_format = st.column_config.NumberColumn(format="%.1f")
+                st.dataframe(display_df, height=400, column_config={col: number_format for col in display_df.columns})
+
 
 # Streamlit UI
 st.title("Dispatch Call Volume Forecaster")
@@ -123,106 +182,58 @@ else:
     scope_cols = st.columns(2)
     with scope_cols[0]:
         st.markdown("**Hospital**")
-        selected_hospital = st.selectbox("Hospital", org_data['hospital_name'].unique(), label_visibility="collapsed", help="Select the hospital you wish to forecast for.")
+        selected_hospital = st.selectbox("Hospital", hospital_names, label_visibility="collapsed", help="Select the hospital you wish to forecast for.")
     with scope_cols[1]:
         st.markdown("**Unit / Floor**")
-        units_for_hospital = org_data[org_data['hospital_name'] == selected_hospital]['unit_name'].tolist()
+        units_for_hospital = hospital_units[selected_hospital]
         selected_unit = st.selectbox("Unit/Floor", ["All"] + units_for_hospital, label_visibility="collapsed", help="Select a specific unit or choose 'All' to forecast for the entire hospital.")
 
-    st.markdown('<h3><i class="fa-solid fa-users"></i> Step 2: Set Patient Census</h3>', unsafe_allow_html=True)
-    unit_census_map = {}
-    if selected_unit == "All":
-        census_cols = st.columns(min(len(units_for_hospital), 4))
-        for i, unit in enumerate(units_for_hospital):
-            census = census_cols[i % 4].number_input(f"{unit}", min_value=0, max_value=40, value=25, step=1, key=unit, help=f"Enter the current number of occupied rooms for {unit} (0-40).")
-            unit_census_map[unit] = census
-    else:
-        census = st.slider(f"Patient Census for {selected_unit}:", 0, 50, 25, 1, help="Adjust the slider to the current number of occupied rooms for this unit.")
-        unit_census_map[selected_unit] = census
+    # Scope selectors stay outside the form because they decide which inputs it shows
+    with st.form("forecast_form", border=False):
+        st.markdown('<h3><i class="fa-solid fa-users"></i> Step 2: Set Patient Census</h3>', unsafe_allow_html=True)
+        # Streamlit drops state for widgets that are not rendered, so censuses are kept here
+        if 'census_map' not in st.session_state:
+            st.session_state['census_map'] = {}
+        census_map = st.session_state['census_map']
+        if selected_unit == "All":
+            census_cols = st.columns(min(len(units_for_hospital), 4))
+            for i, unit in enumerate(units_for_hospital):
+                saved_census = min(census_map.get((selected_hospital, unit), 25), 40)
+                census = census_cols[i % 4].number_input(f"{unit}", min_value=0, max_value=40, value=saved_census, step=1, key=unit, help=f"Enter the current number of occupied rooms for {unit} (0-40).")
+                census_map[(selected_hospital, unit)] = census
+            units_in_scope = units_for_hospital
+        else:
+            saved_census = census_map.get((selected_hospital, selected_unit), 25)
+            census = st.slider(f"Patient Census for {selected_unit}:", 0, 50, saved_census, 1, help="Adjust the slider to the current number of occupied rooms for this unit.")
+            census_map[(selected_hospital, selected_unit)] = census
+            units_in_scope = [selected_unit]
+        unit_census_map = {unit: census_map[(selected_hospital, unit)] for unit in units_in_scope}
     
-    st.markdown('<h3><i class="fa-regular fa-clock"></i> Step 3: Define Time Range</h3>', unsafe_allow_html=True)
-    time_cols = st.columns([1, 2])
-    with time_cols[0]:
-        now = datetime.now()
-        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-        start_date = st.date_input("Start Date", value=next_hour.date(), help="Choose the starting date for your forecast period.")
-        start_time_val = st.time_input("Start Time", value=next_hour.time(), help="Choose the starting hour for your forecast period.")
-        start_datetime = datetime.combine(start_date, start_time_val)
-    with time_cols[1]:
-        duration = st.slider("Forecast Duration (Hours)", 1, 24, 8, 1, help="Select the length of the forecast, from 1 to 24 hours.")
-
-    st.divider()
-
-    if st.button("Forecast Call Volume", type="primary", use_container_width=True):
+        st.markdown('<h3><i class="fa-regular fa-clock"></i> Step 3: Define Time Range</h3>', unsafe_allow_html=True)
+        time_cols = st.columns([1, 2])
+        with time_cols[0]:
+            now = datetime.now()
+            next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            start_date = st.date_input("Start Date", value=next_hour.date(), help="Choose the starting date for your forecast period.")
+            start_time_val = st.time_input("Start Time", value=next_hour.time(), help="Choose the starting hour for your forecast period.")
+            start_datetime = datetime.combine(start_date, start_time_val)
+        with time_cols[1]:
+            duration = st.slider("Forecast Duration (Hours)", 1, 24, 8, 1, help="Select the length of the forecast, from 1 to 24 hours.")
+
+        st.divider()
+
+        submitted = st.form_submit_button("Forecast Call Volume", type="primary", use_container_width=True)
+
+    if submitted:
         with st.spinner("Generating forecast..."):
-            unit_forecasts = {}
-            for unit_name, census_val in unit_census_map.items():
-                org_id = unit_to_org_id_map.get(unit_name)
-                if org_id:
-                    unit_forecasts[unit_name] = generate_single_unit_forecast(start_datetime, duration, census_val, org_id, model_feature_columns)
-            
+            forecast_index, unit_forecasts = generate_multi_unit_forecast(start_datetime, duration, unit_census_map)
+            st.session_state['forecast_index'] = forecast_index
             st.session_state['unit_forecasts'] = unit_forecasts
             st.session_state['details'] = {"hospital": selected_hospital, "unit": selected_unit}
             st.success("Forecast generated!")
 
     if 'unit_forecasts' in st.session_state:
-        st.header(f"📈 Forecast Results for {st.session_state['details']['hospital']}")
-        
-        unit_forecasts = st.session_state['unit_forecasts']
-        all_units = list(unit_forecasts.keys())
-        
-        selected_units_for_view = all_units
-        if st.session_state['details']['unit'] == "All":
-            selected_units_for_view = st.multiselect("Filter units to display:", options=all_units, default=all_units, help="Select one or more units to view their combined forecast.")
-
-        if not selected_units_for_view:
-            st.warning("Please select at least one unit to display results.")
-        else:
-            valid_forecasts = [unit_forecasts[unit] for unit in selected_units_for_view if not unit_forecasts[unit].empty]
-            if not valid_forecasts:
-                st.warning("No valid forecast data to display for the selected units.")
-            else:
-                forecast_df = pd.concat(valid_forecasts).groupby(level=0).sum()
-                
-                total_calls = forecast_df.sum().sum()
-                peak_hour = forecast_df.sum(axis=1).idxmax()
-                peak_volume = forecast_df.sum(axis=1).max()
-                metric_cols = st.columns(3)
-                metric_cols[0].metric("Total Predicted Calls", f"{total_calls:.1f}")
-                metric_cols[1].metric("Predicted Peak Hour", peak_hour.strftime('%H:%M'))
-                metric_cols[2].metric("Calls During Peak Hour", f"{peak_volume:.1f}")
-                
-                st.divider()
-
-                color_map = {'Clinical': '#6366F1', 'Mobility': '#14B8A6', 'Basic Need': '#F97316', 'Housekeeping': '#EC4899', 'Other': '#6B7280'}
-                
-                st.subheader("Hourly Call Volume by Category")
-                fig_area = go.Figure()
-                for category in forecast_df.columns:
-                    fig_area.add_trace(go.Scatter(
-                        x=forecast_df.index, y=forecast_df[category], mode='lines', stackgroup='one',
-                        name=category, fillcolor=color_map.get(category), line=dict(width=0.5)
-                    ))
-                fig_area.update_layout(template="plotly_dark", hovermode='x unified', margin=dict(t=10, b=10), height=400,
-                                       legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-                st.plotly_chart(fig_area, use_container_width=True)
-
-                col_left, col_right = st.columns(2)
-                with col_left:
-                    st.subheader("Total Call Distribution")
-                    category_totals = forecast_df.sum().sort_values(ascending=False)
-                    fig_pie = go.Figure(data=[go.Pie(labels=category_totals.index, values=category_totals.values, hole=0.4,
-                                                     marker=dict(colors=[color_map.get(cat) for cat in category_totals.index]))])
-                    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-                    fig_pie.update_layout(showlegend=False, margin=dict(t=10, b=10), height=400, template="plotly_dark")
-                    st.plotly_chart(fig_pie, use_container_width=True)
-
-                with col_right:
-                    st.subheader("Detailed Forecast Data")
-                    display_df = forecast_df.copy()
-                    display_df['Total'] = display_df.sum(axis=1)
-                    display_df.index = display_df.index.strftime('%Y-%m-%d %H:%M')
-                    st.dataframe(display_df.style.format("{:.1f}"), height=400)
+        render_forecast_results()
 
     st.divider()
     with st.expander("About This Application"):
@@ -235,6 +246,6 @@ else:
         Incoming calls on the system are categorized according to the descriptions below:
         """)
         st.dataframe(pd.DataFrame({
-            "Category": ["Clinical", "Mobility", "Basic Need", "Housekeeping", "Other"],
+            "Category": CALL_CATEGORIES,
             "Description": ["Medical issues, pain, medications", "Movement, bathroom, repositioning", "Food, water, meal requests", "Cleaning, linens, environment", "Administrative, personal, and miscellaneous"]
         }), use_container_width=True, hide_index=True)
\ No newline at end of file